@@ -1,449 +1,566 @@
-import cv2
-import time
-import threading
-from typing import Optional, Tuple, Dict
-import logging
-
-logger = logging.getLogger(__name__)
-
-class FaceAuthenticator:
-    def __init__(self, face_system, camera_index: int = 0):
-        self.face_system = face_system
-        self.camera_index = camera_index
-        self.camera = None
-        self.is_camera_running = False
-        self.last_authentication = None
-        self.auth_lock = threading.Lock()
-        
-        self.auth_timeout = 30
-        self.min_confidence = 0.14
-        self.required_consecutive_frames = 3
-        
-        self.stats = {
-            "auth_attempts": 0,
-            "successful_auths": 0,
-            "failed_auths": 0,
-            "registration_attempts": 0,
-            "successful_registrations": 0
-        }
-        
-        logger.info("FaceAuthenticator inicializado")
-
-    def start_camera(self) -> bool:
-        try:
-            if self.camera is None or not self.camera.isOpened():
-                self.camera = cv2.VideoCapture(self.camera_index)
-                
-                if not self.camera.isOpened():
-                    logger.error("No se pudo abrir la cámara")
-                    return False
-                
-                self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-                self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-                
-                self.is_camera_running = True
-                logger.info("Cámara iniciada correctamente")
-                return True
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error al iniciar cámara: {e}")
-            return False
-
-    def stop_camera(self):
-        if self.camera and self.camera.isOpened():
-            self.camera.release()
-            self.camera = None
-        
-        self.is_camera_running = False
-        logger.info("Cámara detenida")
-
-    def capture_frame(self):
-        if not self.camera or not self.camera.isOpened():
-            if not self.start_camera():
-                return None
-        
-        try:
-            ret, frame = self.camera.read()
-            if ret and frame is not None:
-                frame = cv2.flip(frame, 1)
-                return frame
-            
-            return None
-            
-        except Exception as e:
-            logger.error(f"Error capturando frame: {e}")
-            return None
-
-    def authenticate_user(self, timeout: int = None) -> Tuple[bool, Optional[str], float]:
-        if timeout is None:
-            timeout = self.auth_timeout
-        
-        logger.info(f"Iniciando autenticación (timeout: {timeout}s)")
-        self.stats["auth_attempts"] += 1
-        
-        if self.face_system.get_user_count() == 0:
-            logger.warning("No hay usuarios registrados para autenticar")
-            return False, None, 0.0
-        
-        if not self.start_camera():
-            return False, None, 0.0
-        
-        start_time = time.time()
-        consecutive_matches = 0
-        best_match = None
-        best_confidence = 0.0
-        
-        try:
-            while time.time() - start_time < timeout:
-                frame = self.capture_frame()
-                if frame is None:
-                    time.sleep(0.1)
-                    continue
-                
-                face_locations = self.face_system.detect_faces(frame)
-                
-                if not face_locations:
-                    cv2.putText(frame, "No se detectan rostros", (10, 30),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-                    cv2.imshow("Autenticacion - Asistente Virtual", frame)
-                    
-                    if cv2.waitKey(1) & 0xFF == ord('q'):
-                        break
-                    
-                    time.sleep(0.1)
-                    continue
-                
-                x1, y1, x2, y2 = face_locations[0]
-                face_region = frame[y1:y2, x1:x2]
-                
-                if face_region.size == 0:
-                    time.sleep(0.1)
-                    continue
-                
-                name, confidence = self.face_system.recognize_face(face_region)
-                
-                from face_utils import FaceUtils
-                utils = FaceUtils()
-                
-                frame = utils.draw_face_boxes(
-                    frame,
-                    face_locations,
-                    [name],
-                    [confidence]
-                )
-                
-                elapsed = time.time() - start_time
-                remaining = max(0, timeout - elapsed)
-                
-                cv2.putText(frame, f"Tiempo: {remaining:.1f}s", (10, 60),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-                
-                cv2.putText(frame, "Presiona 'q' para cancelar", (10, 90),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 200), 1)
-                
-                cv2.imshow("Autenticacion - Asistente Virtual", frame)
-                
-                if name != "Desconocido" and confidence >= self.min_confidence:
-                    consecutive_matches += 1
-                    
-                    if confidence > best_confidence:
-                        best_match = name
-                        best_confidence = confidence
-                    
-                    if consecutive_matches >= self.required_consecutive_frames:
-                        logger.info(f"Autenticación exitosa: {name} ({confidence:.2%})")
-                        
-                        self.stats["successful_auths"] += 1
-                        self.last_authentication = {
-                            "username": name,
-                            "confidence": confidence,
-                            "timestamp": time.time()
-                        }
-                        
-                        cv2.waitKey(500)
-                        cv2.destroyAllWindows()
-                        
-                        return True, name, confidence
-                else:
-                    consecutive_matches = 0
-                
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    logger.info("Autenticación cancelada por el usuario")
-                    break
-        
-        except Exception as e:
-            logger.error(f"Error durante autenticación: {e}")
-        
-        finally:
-            cv2.destroyAllWindows()
-        
-        self.stats["failed_auths"] += 1
-        logger.warning("Autenticación fallida o tiempo agotado")
-        
-        return False, best_match, best_confidence
-
-    def register_new_user(self, username: str) -> Tuple[bool, str]:
-        logger.info(f"Iniciando registro para usuario: {username}")
-        self.stats["registration_attempts"] += 1
-        
-        if not username or len(username.strip()) < 2:
-            return False, "El nombre debe tener al menos 2 caracteres"
-        
-        if not self.start_camera():
-            return False, "No se pudo iniciar la cámara"
-        
-        captured_frame = None
-        registration_complete = False
-        message = ""
-        
-        try:
-            print(f"\nRegistrando usuario: {username}")
-            print("   Instrucciones:")
-            print("   1. Colócate frente a la cámara")
-            print("   2. Asegúrate de tener buena iluminación")
-            print("   3. Presiona ESPACIO para capturar")
-            print("   4. Presiona 'q' para cancelar")
-            
-            while not registration_complete:
-                frame = self.capture_frame()
-                if frame is None:
-                    time.sleep(0.1)
-                    continue
-                
-                face_locations = self.face_system.detect_faces(frame)
-                display_frame = frame.copy()
-                
-                if face_locations:
-                    x1, y1, x2, y2 = face_locations[0]
-                    face_region = frame[y1:y2, x1:x2]
-                    
-                    from face_utils import FaceUtils
-                    utils = FaceUtils()
-                    
-                    quality_score, problems = utils.calculate_face_quality(face_region)
-                    
-                    color = (0, 255, 0) if quality_score >= 70 else (0, 165, 255) if quality_score >= 50 else (0, 0, 255)
-                    
-                    cv2.rectangle(display_frame, (x1, y1), (x2, y2), color, 2)
-                    cv2.putText(display_frame, f"Calidad: {quality_score}/100",
-                               (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-                    
-                    if problems:
-                        for i, problem in enumerate(problems[:2]):
-                            cv2.putText(display_frame, problem, (10, 60 + i*25),
-                                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-                    
-                    cv2.putText(display_frame, "ESPACIO: Capturar | q: Cancelar",
-                               (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-                    
-                    if quality_score < 50:
-                        cv2.putText(display_frame, "MUEVETE/ILUMINATE MEJOR",
-                                   (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-                    
-                else:
-                    cv2.putText(display_frame, "ACERCATE A LA CAMARA",
-                               (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-                    cv2.putText(display_frame, "ESPACIO: Capturar | q: Cancelar",
-                               (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
-                
-                cv2.putText(display_frame, f"Usuario: {username}",
-                           (10, display_frame.shape[0] - 20),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-                
-                cv2.imshow(f"Registro: {username}", display_frame)
-                
-                key = cv2.waitKey(1) & 0xFF
-                
-                if key == ord(' '):
-                    if face_locations and len(face_locations) == 1:
-                        if quality_score >= 50:
-                            captured_frame = frame
-                            success, message = self.face_system.register_face(captured_frame, username)
-                            
-                            if success:
-                                self.stats["successful_registrations"] += 1
-                                registration_complete = True
-                            else:
-                                cv2.putText(display_frame, f"ERROR: {message}",
-                                           (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
-                                cv2.imshow(f"Registro: {username}", display_frame)
-                                cv2.waitKey(2000)
-                        
-                        else:
-                            cv2.putText(display_frame, "CALIDAD INSUFICIENTE",
-                                       (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-                            cv2.putText(display_frame, "Mejora la iluminacion/posicion",
-                                       (10, 180), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-                            cv2.imshow(f"Registro: {username}", display_frame)
-                            cv2.waitKey(1500)
-                    
-                    else:
-                        error_msg = "MULTIPLES ROSTROS" if len(face_locations) > 1 else "NO HAY ROSTRO"
-                        cv2.putText(display_frame, error_msg,
-                                   (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-                        cv2.imshow(f"Registro: {username}", display_frame)
-                        cv2.waitKey(1500)
-                
-                elif key == ord('q'):
-                    message = "Registro cancelado por el usuario"
-                    registration_complete = True
-        
-        except Exception as e:
-            logger.error(f"Error durante registro: {e}")
-            message = f"Error durante registro: {str(e)}"
-        
-        finally:
-            cv2.destroyAllWindows()
-        
-        if registration_complete and captured_frame is not None and "exitosamente" in message:
-            return True, message
-        else:
-            if not message:
-                message = "Registro fallido"
-            return False, message
-
-    def get_status(self) -> Dict:
-        return {
-            "camera_running": self.is_camera_running,
-            "camera_index": self.camera_index,
-            "users_registered": self.face_system.get_user_count(),
-            "last_authentication": self.last_authentication,
-            "auth_timeout": self.auth_timeout,
-            "min_confidence": self.min_confidence,
-            "stats": self.stats.copy()
-        }
-
-    def reset_stats(self):
-        self.stats = {
-            "auth_attempts": 0,
-            "successful_auths": 0,
-            "failed_auths": 0,
-            "registration_attempts": 0,
-            "successful_registrations": 0
-        }
-        logger.info("Estadísticas reiniciadas")
-
-def run_authentication_flow(face_system=None):
-    try:
-        if face_system is None:
-            from face_system import FaceSystem
-            face_system = FaceSystem()
-        
-        authenticator = FaceAuthenticator(face_system)
-        
-        print("\n" + "=" * 50)
-        print("FLUJO DE AUTENTICACIÓN FACIAL")
-        print("=" * 50)
-        
-        if face_system.get_user_count() == 0:
-            print("\nNo hay usuarios registrados.")
-            print("   ¿Deseas registrar un nuevo usuario? (s/n)")
-            
-            if input().strip().lower() == 's':
-                username = input("Nombre del nuevo usuario: ").strip()
-                if username:
-                    success, message = authenticator.register_new_user(username)
-                    print(f"\n{message}")
-                    
-                    if success:
-                        print("\nUsuario registrado. Ahora puedes autenticarte.")
-                    else:
-                        return False, None, 0.0
-            else:
-                return False, None, 0.0
-        
-        print("\nColócate frente a la cámara para autenticarte...")
-        print("   Tienes 30 segundos para reconocerte.")
-        print("   Presiona 'q' en la ventana para cancelar.")
-        
-        success, username, confidence = authenticator.authenticate_user(timeout=10)
-        
-        if success:
-            print(f"\n¡Autenticación exitosa!")
-            print(f"   Bienvenido/a: {username}")
-            print(f"   Confianza: {confidence:.2%}")
-        else:
-            print("\nAutenticación fallida")
-            if username:
-                print(f"   Mejor coincidencia: {username} ({confidence:.2%})")
-        
-        authenticator.stop_camera()
-        return success, username, confidence
-        
-    except Exception as e:
-        print(f"Error en el flujo de autenticación: {e}")
-        return False, None, 0.0
-
-if __name__ == "__main__":
-    print("PRUEBA DE FACE_AUTH")
-    print("=" * 50)
-    
-    try:
-        from face_system import FaceSystem
-        
-        face_system = FaceSystem()
-        authenticator = FaceAuthenticator(face_system)
-        
-        print("Módulos cargados correctamente")
-        
-        status = authenticator.get_status()
-        print(f"\nEstado inicial:")
-        print(f"   Usuarios registrados: {status['users_registered']}")
-        print(f"   Cámara: {'Conectada' if status['camera_running'] else 'Desconectada'}")
-        
-        while True:
-            print("\n" + "=" * 50)
-            print("MENÚ DE PRUEBAS - FACE_AUTH")
-            print("=" * 50)
-            print("1. Probar autenticación (30 segundos)")
-            print("2. Registrar nuevo usuario")
-            print("3. Ver estadísticas")
-            print("4. Reiniciar estadísticas")
-            print("5. Salir")
-            
-            choice = input("\nSelecciona opción (1-5): ").strip()
-            
-            if choice == "1":
-                print("\nIniciando autenticación...")
-                success, username, confidence = authenticator.authenticate_user(timeout=30)
-                
-                if success:
-                    print(f"¡Autenticado como {username}! (confianza: {confidence:.2%})")
-                else:
-                    print("Autenticación fallida")
-            
-            elif choice == "2":
-                username = input("Nombre del nuevo usuario: ").strip()
-                if username:
-                    success, message = authenticator.register_new_user(username)
-                    print(f"\nResultado: {message}")
-            
-            elif choice == "3":
-                status = authenticator.get_status()
-                stats = status['stats']
-                print(f"\nEstadísticas:")
-                print(f"   Intentos de autenticación: {stats['auth_attempts']}")
-                print(f"   Autenticaciones exitosas: {stats['successful_auths']}")
-                print(f"   Autenticaciones fallidas: {stats['failed_auths']}")
-                print(f"   Intentos de registro: {stats['registration_attempts']}")
-                print(f"   Registros exitosos: {stats['successful_registrations']}")
-            
-            elif choice == "4":
-                authenticator.reset_stats()
-                print("Estadísticas reiniciadas")
-            
-            elif choice == "5":
-                print("Saliendo...")
-                authenticator.stop_camera()
-                break
-            
-            else:
-                print("Opción no válida")
-    
-    except ImportError as e:
-        print(f"Error de importación: {e}")
-        print("Asegúrate de que face_system.py esté en la misma carpeta.")
-    except Exception as e:
+import cv2
+import time
+import threading
+import numpy as np
+from typing import Optional, Tuple, Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pygame
+    PYGAME_AVAILABLE = True
+except ImportError:
+    PYGAME_AVAILABLE = False
+
+class FaceAuthenticator:
+    # Índices del array de estadísticas (ver self.stats)
+    IDX_AUTH_ATTEMPTS = 0
+    IDX_SUCCESSFUL_AUTHS = 1
+    IDX_FAILED_AUTHS = 2
+    IDX_REGISTRATION_ATTEMPTS = 3
+    IDX_SUCCESSFUL_REGISTRATIONS = 4
+
+    def __init__(self, face_system, camera_index: int = 0, display: bool = True,
+                 display_backend: str = "cv2"):
+        self.face_system = face_system
+        self.camera_index = camera_index
+        self.camera = None
+        self.is_camera_running = False
+        self.last_authentication = None
+        self.auth_lock = threading.Lock()
+
+        # En modo headless (display=False) no se usa HighGUI; la cancelación
+        # se hace con este evento en lugar de la tecla 'q'.
+        self.display = display
+        self.cancel_event = threading.Event()
+        self._auth_win = "Autenticacion - Asistente Virtual"
+
+        # Backend de vídeo: "cv2" (HighGUI) o "sdl" (pygame, más barato en
+        # equipos embebidos sin X11 acelerado).
+        if display_backend == "sdl" and not PYGAME_AVAILABLE:
+            logger.warning("pygame no disponible, usando backend cv2")
+            display_backend = "cv2"
+        self.display_backend = display_backend
+        self._sdl_screen = None
+
+        # Mantener OpenCV en un solo hilo: el flip/cvtColor por frame es
+        # pequeño y los hilos TBB extra compiten con el detector de MediaPipe.
+        cv2.setNumThreads(1)
+        
+        self.auth_timeout = 30
+        # Umbrales sobre la confianza coseno (sim + 1) / 2 de FaceSystem
+        self.min_confidence = 0.90
+        self.required_consecutive_frames = 3
+        # Con confianza muy alta basta un solo frame para autenticar
+        self.high_confidence_shortcut = 0.97
+        
+        # Contadores tipados: incrementos atómicos y sin hashing de strings
+        # en el bucle de autenticación.
+        self.stats = np.zeros(5, dtype=np.int64)
+
+        logger.info("FaceAuthenticator inicializado")
+
+    def _ensure_display(self, title: str):
+        if self.display_backend == "sdl":
+            if self._sdl_screen is None:
+                pygame.display.init()
+                self._sdl_screen = pygame.display.set_mode((640, 480))
+            pygame.display.set_caption(title)
+        else:
+            cv2.namedWindow(title, cv2.WINDOW_AUTOSIZE)
+
+    def _show(self, title: str, frame):
+        if self.display_backend == "sdl":
+            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB).swapaxes(0, 1)
+            pygame.surfarray.blit_array(self._sdl_screen, rgb)
+            pygame.display.flip()
+        else:
+            cv2.imshow(title, frame)
+
+    def _wait_key(self, delay: int = 1) -> int:
+        """Espera delay ms procesando eventos; devuelve la tecla pulsada o 255."""
+        if self.display_backend == "sdl":
+            key = 255
+            for event in pygame.event.get():
+                if event.type == pygame.KEYDOWN:
+                    key = event.key & 0xFF
+            if delay > 1:
+                time.sleep(delay / 1000.0)
+            return key
+        return cv2.waitKey(delay) & 0xFF
+
+    def _close_display(self):
+        if self.display_backend == "sdl":
+            if self._sdl_screen is not None:
+                pygame.display.quit()
+                self._sdl_screen = None
+        else:
+            cv2.destroyAllWindows()
+
+    def start_camera(self) -> bool:
+        try:
+            if self.camera is None or not self.camera.isOpened():
+                self.camera = cv2.VideoCapture(self.camera_index)
+                
+                if not self.camera.isOpened():
+                    logger.error("No se pudo abrir la cámara")
+                    return False
+                
+                self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+                self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+                
+                self.is_camera_running = True
+                logger.info("Cámara iniciada correctamente")
+                return True
+            
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error al iniciar cámara: {e}")
+            return False
+
+    def stop_camera(self):
+        if self.camera and self.camera.isOpened():
+            self.camera.release()
+            self.camera = None
+        
+        self.is_camera_running = False
+        logger.info("Cámara detenida")
+
+    def capture_frame(self):
+        if not self.camera or not self.camera.isOpened():
+            if not self.start_camera():
+                return None
+        
+        try:
+            ret, frame = self.camera.read()
+            if ret and frame is not None:
+                frame = cv2.flip(frame, 1)
+                return frame
+            
+            return None
+            
+        except Exception as e:
+            logger.error(f"Error capturando frame: {e}")
+            return None
+
+    def authenticate_user(self, timeout: int = None) -> Tuple[bool, Optional[str], float]:
+        if timeout is None:
+            timeout = self.auth_timeout
+        
+        logger.info(f"Iniciando autenticación (timeout: {timeout}s)")
+        self.stats[self.IDX_AUTH_ATTEMPTS] += 1
+        self.cancel_event.clear()
+        
+        if self.face_system.get_user_count() == 0:
+            logger.warning("No hay usuarios registrados para autenticar")
+            return False, None, 0.0
+        
+        if not self.start_camera():
+            return False, None, 0.0
+
+        if self.display:
+            self._ensure_display(self._auth_win)
+
+        start_time = time.time()
+        consecutive_matches = 0
+        best_match = None
+        best_confidence = 0.0
+        
+        try:
+            while time.time() - start_time < timeout:
+                frame = self.capture_frame()
+                if frame is None:
+                    # Espera corta que además procesa eventos de la ventana
+                    if self.display:
+                        if self._wait_key(30) == ord('q'):
+                            break
+                    elif self.cancel_event.wait(0.03):
+                        break
+                    continue
+
+                face_locations = self.face_system.detect_faces(frame)
+
+                if not face_locations:
+                    if self.display:
+                        cv2.putText(frame, "No se detectan rostros", (10, 30),
+                                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+                        self._show(self._auth_win, frame)
+
+                        if self._wait_key(30) == ord('q'):
+                            break
+                    elif self.cancel_event.wait(0.03):
+                        break
+
+                    continue
+
+                x1, y1, x2, y2 = face_locations[0]
+                face_region = frame[y1:y2, x1:x2]
+
+                if face_region.size == 0:
+                    continue
+                
+                name, confidence = self.face_system.recognize_face(face_region)
+
+                if self.display:
+                    from face_utils import FaceUtils
+                    utils = FaceUtils()
+
+                    frame = utils.draw_face_boxes(
+                        frame,
+                        face_locations,
+                        [name],
+                        [confidence]
+                    )
+
+                    elapsed = time.time() - start_time
+                    remaining = max(0, timeout - elapsed)
+
+                    cv2.putText(frame, f"Tiempo: {remaining:.1f}s", (10, 60),
+                               cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
+                    cv2.putText(frame, "Presiona 'q' para cancelar", (10, 90),
+                               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 200), 1)
+
+                    self._show(self._auth_win, frame)
+                
+                if name != "Desconocido" and confidence >= self.min_confidence:
+                    consecutive_matches += 1
+                    
+                    if confidence > best_confidence:
+                        best_match = name
+                        best_confidence = confidence
+                    
+                    if (consecutive_matches >= self.required_consecutive_frames
+                            or confidence >= self.high_confidence_shortcut):
+                        logger.info(f"Autenticación exitosa: {name} ({confidence:.2%})")
+                        
+                        self.stats[self.IDX_SUCCESSFUL_AUTHS] += 1
+                        self.last_authentication = {
+                            "username": name,
+                            "confidence": confidence,
+                            "timestamp": time.time()
+                        }
+                        
+                        if self.display:
+                            self._wait_key(500)
+                            self._close_display()
+
+                        return True, name, confidence
+                else:
+                    consecutive_matches = 0
+
+                if self.display:
+                    if self._wait_key(1) == ord('q'):
+                        logger.info("Autenticación cancelada por el usuario")
+                        break
+                elif self.cancel_event.is_set():
+                    logger.info("Autenticación cancelada por el usuario")
+                    break
+        
+        except Exception as e:
+            logger.error(f"Error durante autenticación: {e}")
+        
+        finally:
+            if self.display:
+                self._close_display()
+
+        self.stats[self.IDX_FAILED_AUTHS] += 1
+        logger.warning("Autenticación fallida o tiempo agotado")
+        
+        return False, best_match, best_confidence
+
+    def register_new_user(self, username: str) -> Tuple[bool, str]:
+        logger.info(f"Iniciando registro para usuario: {username}")
+        self.stats[self.IDX_REGISTRATION_ATTEMPTS] += 1
+        
+        if not username or len(username.strip()) < 2:
+            return False, "El nombre debe tener al menos 2 caracteres"
+        
+        if not self.start_camera():
+            return False, "No se pudo iniciar la cámara"
+        
+        captured_frame = None
+        registration_complete = False
+        message = ""
+
+        # Título construido una sola vez; evita el f-string por frame y la
+        # comprobación implícita de creación de ventana en cada imshow.
+        win = f"Registro: {username}"
+        if self.display:
+            self._ensure_display(win)
+
+        try:
+            print(f"\nRegistrando usuario: {username}")
+            print("   Instrucciones:")
+            print("   1. Colócate frente a la cámara")
+            print("   2. Asegúrate de tener buena iluminación")
+            print("   3. Presiona ESPACIO para capturar")
+            print("   4. Presiona 'q' para cancelar")
+            
+            while not registration_complete:
+                frame = self.capture_frame()
+                if frame is None:
+                    if self.display:
+                        self._wait_key(30)
+                    elif self.cancel_event.wait(0.03):
+                        break
+                    continue
+                
+                face_locations = self.face_system.detect_faces(frame)
+                display_frame = frame.copy()
+                quality_score = 0
+
+                if face_locations:
+                    x1, y1, x2, y2 = face_locations[0]
+
+                    from face_utils import FaceUtils
+                    utils = FaceUtils()
+
+                    quality_score, problems = utils.calculate_face_quality_batch(
+                        frame, face_locations
+                    )[0]
+
+                    if self.display:
+                        color = (0, 255, 0) if quality_score >= 70 else (0, 165, 255) if quality_score >= 50 else (0, 0, 255)
+
+                        cv2.rectangle(display_frame, (x1, y1), (x2, y2), color, 2)
+                        cv2.putText(display_frame, f"Calidad: {quality_score}/100",
+                                   (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+
+                        if problems:
+                            for i, problem in enumerate(problems[:2]):
+                                cv2.putText(display_frame, problem, (10, 60 + i*25),
+                                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+
+                        cv2.putText(display_frame, "ESPACIO: Capturar | q: Cancelar",
+                                   (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
+                        if quality_score < 50:
+                            cv2.putText(display_frame, "MUEVETE/ILUMINATE MEJOR",
+                                       (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+
+                elif self.display:
+                    cv2.putText(display_frame, "ACERCATE A LA CAMARA",
+                               (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+                    cv2.putText(display_frame, "ESPACIO: Capturar | q: Cancelar",
+                               (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
+
+                if self.display:
+                    cv2.putText(display_frame, f"Usuario: {username}",
+                               (10, display_frame.shape[0] - 20),
+                               cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
+                    self._show(win, display_frame)
+
+                    key = self._wait_key(1)
+                else:
+                    # Sin ventana: capturar automáticamente cuando el rostro
+                    # tiene calidad suficiente, cancelar vía cancel_event.
+                    if self.cancel_event.is_set():
+                        key = ord('q')
+                    elif len(face_locations) == 1 and quality_score >= 50:
+                        # Solo con exactamente un rostro: con varios, la
+                        # captura fallaría y reintentaría cada frame
+                        key = ord(' ')
+                    else:
+                        key = 255
+
+                if key == ord(' '):
+                    if face_locations and len(face_locations) == 1:
+                        if quality_score >= 50:
+                            captured_frame = frame
+                            success, message = self.face_system.register_face(captured_frame, username)
+                            
+                            if success:
+                                self.stats[self.IDX_SUCCESSFUL_REGISTRATIONS] += 1
+                                registration_complete = True
+                            elif self.display:
+                                cv2.putText(display_frame, f"ERROR: {message}",
+                                           (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+                                self._show(win, display_frame)
+                                self._wait_key(2000)
+                            else:
+                                # Sin ventana no hay forma de corregir el
+                                # fallo (p. ej. nombre duplicado): devolver
+                                # el mensaje en vez de reintentar por frame
+                                registration_complete = True
+
+                        elif self.display:
+                            cv2.putText(display_frame, "CALIDAD INSUFICIENTE",
+                                       (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+                            cv2.putText(display_frame, "Mejora la iluminacion/posicion",
+                                       (10, 180), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+                            self._show(win, display_frame)
+                            self._wait_key(1500)
+
+                    elif self.display:
+                        error_msg = "MULTIPLES ROSTROS" if len(face_locations) > 1 else "NO HAY ROSTRO"
+                        cv2.putText(display_frame, error_msg,
+                                   (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+                        self._show(win, display_frame)
+                        self._wait_key(1500)
+                
+                elif key == ord('q'):
+                    message = "Registro cancelado por el usuario"
+                    registration_complete = True
+        
+        except Exception as e:
+            logger.error(f"Error durante registro: {e}")
+            message = f"Error durante registro: {str(e)}"
+
+        finally:
+            if self.display:
+                self._close_display()
+        
+        if registration_complete and captured_frame is not None and "exitosamente" in message:
+            return True, message
+        else:
+            if not message:
+                message = "Registro fallido"
+            return False, message
+
+    def get_status(self) -> Dict:
+        return {
+            "camera_running": self.is_camera_running,
+            "camera_index": self.camera_index,
+            "users_registered": self.face_system.get_user_count(),
+            "last_authentication": self.last_authentication,
+            "auth_timeout": self.auth_timeout,
+            "min_confidence": self.min_confidence,
+            "stats": {
+                "auth_attempts": int(self.stats[self.IDX_AUTH_ATTEMPTS]),
+                "successful_auths": int(self.stats[self.IDX_SUCCESSFUL_AUTHS]),
+                "failed_auths": int(self.stats[self.IDX_FAILED_AUTHS]),
+                "registration_attempts": int(self.stats[self.IDX_REGISTRATION_ATTEMPTS]),
+                "successful_registrations": int(self.stats[self.IDX_SUCCESSFUL_REGISTRATIONS])
+            }
+        }
+
+    def reset_stats(self):
+        self.stats = np.zeros(5, dtype=np.int64)
+        logger.info("Estadísticas reiniciadas")
+
+def run_authentication_flow(face_system=None):
+    try:
+        if face_system is None:
+            from face_system import FaceSystem
+            face_system = FaceSystem()
+        
+        authenticator = FaceAuthenticator(face_system)
+        
+        print("\n" + "=" * 50)
+        print("FLUJO DE AUTENTICACIÓN FACIAL")
+        print("=" * 50)
+        
+        if face_system.get_user_count() == 0:
+            print("\nNo hay usuarios registrados.")
+            print("   ¿Deseas registrar un nuevo usuario? (s/n)")
+            
+            if input().strip().lower() == 's':
+                username = input("Nombre del nuevo usuario: ").strip()
+                if username:
+                    success, message = authenticator.register_new_user(username)
+                    print(f"\n{message}")
+                    
+                    if success:
+                        print("\nUsuario registrado. Ahora puedes autenticarte.")
+                    else:
+                        return False, None, 0.0
+            else:
+                return False, None, 0.0
+        
+        print("\nColócate frente a la cámara para autenticarte...")
+        print("   Tienes 30 segundos para reconocerte.")
+        print("   Presiona 'q' en la ventana para cancelar.")
+        
+        success, username, confidence = authenticator.authenticate_user(timeout=10)
+        
+        if success:
+            print(f"\n¡Autenticación exitosa!")
+            print(f"   Bienvenido/a: {username}")
+            print(f"   Confianza: {confidence:.2%}")
+        else:
+            print("\nAutenticación fallida")
+            if username:
+                print(f"   Mejor coincidencia: {username} ({confidence:.2%})")
+        
+        authenticator.stop_camera()
+        return success, username, confidence
+        
+    except Exception as e:
+        print(f"Error en el flujo de autenticación: {e}")
+        return False, None, 0.0
+
+if __name__ == "__main__":
+    print("PRUEBA DE FACE_AUTH")
+    print("=" * 50)
+    
+    try:
+        from face_system import FaceSystem
+        
+        face_system = FaceSystem()
+        authenticator = FaceAuthenticator(face_system)
+        
+        print("Módulos cargados correctamente")
+        
+        status = authenticator.get_status()
+        print(f"\nEstado inicial:")
+        print(f"   Usuarios registrados: {status['users_registered']}")
+        print(f"   Cámara: {'Conectada' if status['camera_running'] else 'Desconectada'}")
+        
+        while True:
+            print("\n" + "=" * 50)
+            print("MENÚ DE PRUEBAS - FACE_AUTH")
+            print("=" * 50)
+            print("1. Probar autenticación (30 segundos)")
+            print("2. Registrar nuevo usuario")
+            print("3. Ver estadísticas")
+            print("4. Reiniciar estadísticas")
+            print("5. Salir")
+            
+            choice = input("\nSelecciona opción (1-5): ").strip()
+            
+            if choice == "1":
+                print("\nIniciando autenticación...")
+                success, username, confidence = authenticator.authenticate_user(timeout=30)
+                
+                if success:
+                    print(f"¡Autenticado como {username}! (confianza: {confidence:.2%})")
+                else:
+                    print("Autenticación fallida")
+            
+            elif choice == "2":
+                username = input("Nombre del nuevo usuario: ").strip()
+                if username:
+                    success, message = authenticator.register_new_user(username)
+                    print(f"\nResultado: {message}")
+            
+            elif choice == "3":
+                status = authenticator.get_status()
+                stats = status['stats']
+                print(f"\nEstadísticas:")
+                print(f"   Intentos de autenticación: {stats['auth_attempts']}")
+                print(f"   Autenticaciones exitosas: {stats['successful_auths']}")
+                print(f"   Autenticaciones fallidas: {stats['failed_auths']}")
+                print(f"   Intentos de registro: {stats['registration_attempts']}")
+                print(f"   Registros exitosos: {stats['successful_registrations']}")
+            
+            elif choice == "4":
+                authenticator.reset_stats()
+                print("Estadísticas reiniciadas")
+            
+            elif choice == "5":
+                print("Saliendo...")
+                authenticator.stop_camera()
+                break
+            
+            else:
+                print("Opción no válida")
+    
+    except ImportError as e:
+        print(f"Error de importación: {e}")
+        print("Asegúrate de que face_system.py esté en la misma carpeta.")
+    except Exception as e:
         print(f"Error: {e}")
\ No newline at end of file
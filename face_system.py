@@ -1,459 +1,1269 @@
-import os
-import cv2
-import pickle
-import numpy as np
-from datetime import datetime
-import json
-from pathlib import Path
-import logging
-
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-class FaceSystem:
-    def __init__(self, registros_path="data/known_faces", cache_path="data/cache"):
-        self.base_path = Path(registros_path)
-        self.cache_path = Path(cache_path)
-        self.encodings_cache = self.cache_path / "face_embeddings.pkl"
-        
-        self.base_path.mkdir(parents=True, exist_ok=True)
-        self.cache_path.mkdir(parents=True, exist_ok=True)
-        
-        try:
-            import mediapipe as mp
-            self.mp = mp
-            
-            self.face_detection = mp.solutions.face_detection.FaceDetection(
-                model_selection=1,
-                min_detection_confidence=0.5
-            )
-            
-            self.face_mesh = mp.solutions.face_mesh.FaceMesh(
-                static_image_mode=True,
-                max_num_faces=1,
-                refine_landmarks=True,
-                min_detection_confidence=0.5,
-                min_tracking_confidence=0.5
-            )
-            
-            self.face_detection_available = True
-            logger.info("MediaPipe inicializado correctamente")
-            
-        except ImportError as e:
-            logger.error(f"Error al importar MediaPipe: {e}")
-            self.face_detection_available = False
-            raise ImportError("MediaPipe no está instalado. Ejecuta: pip install mediapipe==0.10.14")
-        
-        self.known_embeddings = []
-        self.known_names = []
-        
-        self.min_face_size = 100
-        self.confidence_threshold = 0.14
-        
-        self.load_database()
-        
-        logger.info(f"Sistema facial inicializado. Usuarios registrados: {len(self.known_names)}")
-
-    def load_database(self):
-        logger.info("Cargando base de datos de rostros...")
-        
-        if self._load_from_cache():
-            logger.info(f"Base cargada desde caché: {len(self.known_names)} usuarios")
-            return True
-        
-        return self._load_from_images()
-
-    def _load_from_cache(self):
-        try:
-            if self.encodings_cache.exists():
-                with open(self.encodings_cache, 'rb') as f:
-                    cache_data = pickle.load(f)
-                
-                if 'embeddings' in cache_data and 'names' in cache_data:
-                    self.known_embeddings = cache_data['embeddings']
-                    self.known_names = cache_data['names']
-                    return True
-                    
-        except Exception as e:
-            logger.warning(f"Error cargando caché: {e}")
-        
-        return False
-
-    def _load_from_images(self):
-        valid_extensions = ('.jpg', '.jpeg', '.png', '.bmp')
-        loaded_count = 0
-        
-        for file_path in self.base_path.iterdir():
-            if file_path.suffix.lower() in valid_extensions:
-                try:
-                    image = cv2.imread(str(file_path))
-                    if image is None:
-                        logger.warning(f"No se pudo leer: {file_path.name}")
-                        continue
-                    
-                    embedding = self._extract_face_embedding(image)
-                    
-                    if embedding is not None:
-                        name = file_path.stem
-                        self.known_embeddings.append(embedding)
-                        self.known_names.append(name)
-                        loaded_count += 1
-                        logger.info(f"Cargado: {name}")
-                    
-                except Exception as e:
-                    logger.error(f"Error procesando {file_path.name}: {e}")
-        
-        if loaded_count > 0:
-            self._save_to_cache()
-        
-        logger.info(f"Total usuarios cargados: {loaded_count}")
-        return loaded_count > 0
-
-    def _extract_face_embedding(self, image):
-        try:
-            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            results = self.face_mesh.process(rgb_image)
-            
-            if results.multi_face_landmarks:
-                face_landmarks = results.multi_face_landmarks[0]
-                
-                embedding = []
-                for landmark in face_landmarks.landmark:
-                    embedding.extend([landmark.x, landmark.y, landmark.z])
-                
-                return np.array(embedding, dtype=np.float32)
-            
-            return None
-            
-        except Exception as e:
-            logger.error(f"Error extrayendo embedding: {e}")
-            return None
-
-    def _save_to_cache(self):
-        try:
-            cache_data = {
-                'embeddings': self.known_embeddings,
-                'names': self.known_names,
-                'timestamp': datetime.now().isoformat(),
-                'version': '1.0'
-            }
-            
-            with open(self.encodings_cache, 'wb') as f:
-                pickle.dump(cache_data, f)
-            
-            logger.info(f"Cache guardada: {len(self.known_names)} usuarios")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error guardando caché: {e}")
-            return False
-
-    def register_face(self, image, name):
-        try:
-            safe_name = "".join(c for c in name if c.isalnum() or c in (' ', '_', '-')).strip()
-            if not safe_name or len(safe_name) < 2:
-                return False, "Nombre inválido. Debe tener al menos 2 caracteres."
-            
-            if safe_name in self.known_names:
-                return False, f"El nombre '{safe_name}' ya está registrado."
-            
-            embedding = self._extract_face_embedding(image)
-            if embedding is None:
-                return False, "No se detectó un rostro claro en la imagen."
-            
-            image_path = self.base_path / f"{safe_name}.jpg"
-            cv2.imwrite(str(image_path), image)
-            
-            self.known_embeddings.append(embedding)
-            self.known_names.append(safe_name)
-            
-            self._save_to_cache()
-            self._save_metadata(safe_name, image_path)
-            
-            return True, f"Usuario '{safe_name}' registrado exitosamente."
-            
-        except Exception as e:
-            logger.error(f"Error registrando rostro: {e}")
-            return False, f"Error durante el registro: {str(e)}"
-
-    def _save_metadata(self, name, image_path):
-        try:
-            metadata_path = self.base_path / f"{name}_metadata.json"
-            metadata = {
-                "name": name,
-                "registered_date": datetime.now().isoformat(),
-                "image_path": str(image_path),
-                "last_seen": None,
-                "access_count": 0
-            }
-            
-            with open(metadata_path, 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, indent=2, ensure_ascii=False)
-                
-        except Exception as e:
-            logger.warning(f"Error guardando metadatos: {e}")
-
-    def recognize_face(self, face_image):
-        try:
-            if len(self.known_embeddings) == 0:
-                return "Desconocido", 0.0
-            
-            embedding = self._extract_face_embedding(face_image)
-            if embedding is None:
-                return "Desconocido", 0.0
-            
-            best_match = None
-            best_distance = float('inf')
-            
-            for known_embedding, known_name in zip(self.known_embeddings, self.known_names):
-                distance = np.linalg.norm(embedding - known_embedding)
-                
-                if distance < best_distance:
-                    best_distance = distance
-                    best_match = known_name
-            
-            confidence = 1.0 / (1.0 + best_distance)
-            
-            if confidence >= self.confidence_threshold:
-                return best_match, confidence
-            else:
-                return "Desconocido", confidence
-            
-        except Exception as e:
-            logger.error(f"Error reconociendo rostro: {e}")
-            return "Desconocido", 0.0
-
-    def detect_faces(self, frame):
-        if not self.face_detection_available:
-            return []
-        
-        try:
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = self.face_detection.process(rgb_frame)
-            
-            face_locations = []
-            
-            if results.detections:
-                for detection in results.detections:
-                    bbox = detection.location_data.relative_bounding_box
-                    h, w, _ = frame.shape
-                    
-                    x = int(bbox.xmin * w)
-                    y = int(bbox.ymin * h)
-                    width = int(bbox.width * w)
-                    height = int(bbox.height * h)
-                    
-                    x = max(0, x)
-                    y = max(0, y)
-                    width = min(w - x, width)
-                    height = min(h - y, height)
-                    
-                    face_locations.append((x, y, x + width, y + height))
-            
-            return face_locations
-            
-        except Exception as e:
-            logger.error(f"Error detectando rostros: {e}")
-            return []
-
-    def get_user_count(self):
-        return len(self.known_names)
-
-    def get_user_list(self):
-        return self.known_names.copy()
-
-    def delete_user(self, name):
-        try:
-            if name not in self.known_names:
-                return False, f"Usuario '{name}' no encontrado."
-            
-            idx = self.known_names.index(name)
-            
-            self.known_names.pop(idx)
-            self.known_embeddings.pop(idx)
-            
-            image_path = self.base_path / f"{name}.jpg"
-            metadata_path = self.base_path / f"{name}_metadata.json"
-            
-            if image_path.exists():
-                image_path.unlink()
-            
-            if metadata_path.exists():
-                metadata_path.unlink()
-            
-            self._save_to_cache()
-            
-            return True, f"Usuario '{name}' eliminado exitosamente."
-            
-        except Exception as e:
-            logger.error(f"Error eliminando usuario: {e}")
-            return False, f"Error eliminando usuario: {str(e)}"
-
-    def validate_image_for_registration(self, image):
-        try:
-            if image is None or image.size == 0:
-                return False, "Imagen vacía o no válida."
-            
-            h, w = image.shape[:2]
-            if h < 100 or w < 100:
-                return False, f"Imagen muy pequeña ({w}x{h}). Mínimo 100x100."
-            
-            face_locations = self.detect_faces(image)
-            
-            if len(face_locations) == 0:
-                return False, "No se detectó ningún rostro."
-            
-            if len(face_locations) > 1:
-                return False, "Se detectaron múltiples rostros. Solo debe haber uno."
-            
-            x1, y1, x2, y2 = face_locations[0]
-            face_width = x2 - x1
-            face_height = y2 - y1
-            
-            if face_width < self.min_face_size or face_height < self.min_face_size:
-                return False, f"Rostro muy pequeño ({face_width}x{face_height})."
-            
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            brightness = np.mean(gray)
-            
-            if brightness < 50:
-                return False, "Imagen muy oscura. Mejora la iluminación."
-            elif brightness > 200:
-                return False, "Imagen muy brillante. Reduce la iluminación."
-            
-            return True, "Imagen válida para registro."
-            
-        except Exception as e:
-            logger.error(f"Error validando imagen: {e}")
-            return False, f"Error validando imagen: {str(e)}"
-    
-    def process_frame_with_realtime_auth(self, frame):
-        """Procesar frame con reconocimiento facial usando FaceSystem real"""
-        display_frame = frame.copy()
-        user_data = None
-        
-        if not self.face_system:
-            return self.fallback_face_detection(display_frame), None
-        
-        try:
-            face_locations = self.face_system.detect_faces(frame)
-            
-            if not face_locations:
-                self.face_detected = False
-                self.update_status("Enfócate en la cámara...", "👤", "#ea4335")
-                self.progress_bar.setValue(0)
-                self.consecutive_matches = 0
-                return display_frame, None
-            
-            x1, y1, x2, y2 = face_locations[0]
-            face_region = frame[y1:y2, x1:x2]
-            
-            if face_region.size == 0:
-                return display_frame, None
-            
-            name, confidence = self.face_system.recognize_face(face_region)
-            
-            color = (0, 255, 0) if name != "Desconocido" and confidence >= 0.6 else (0, 0, 255)
-            cv2.rectangle(display_frame, (x1, y1), (x2, y2), color, 2)
-            
-            label = f"{name} ({confidence:.2f})"
-            cv2.putText(display_frame, label, (x1, y1-10), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
-            
-            if name != "Desconocido" and confidence >= 0.6:
-                if name == self.last_detected_name:
-                    self.consecutive_matches += 1
-                else:
-                    self.consecutive_matches = 1
-                    self.last_detected_name = name
-                
-                progress = min(int((self.consecutive_matches / self.REQUIRED_MATCHES) * 100), 100)
-                self.progress_bar.setValue(progress)
-                
-                self.update_status(f"Reconociendo: {name}...", "🔍", "#fbbc04")
-                
-                if self.consecutive_matches >= self.REQUIRED_MATCHES:
-                    user_data = {
-                        "authenticated": True,
-                        "name": name,
-                        "id": f"user_{name.lower().replace(' ', '_')}",
-                        "confidence": confidence,
-                        "auth_method": "facial_recognition",
-                        "auth_timestamp": datetime.now().isoformat(),
-                        "metadata": {
-                            "face_system": "MediaPipe",
-                            "confidence_score": confidence,
-                            "last_seen": datetime.now().isoformat()
-                        }
-                    }
-                    
-                    self.update_status(f"¡Autenticado como {name}!", "✅", "#34a853")
-                    return display_frame, user_data
-            else:
-                self.consecutive_matches = 0
-                self.last_detected_name = None
-                self.update_status("Rostro no reconocido", "❓", "#ea4335")
-            
-            return display_frame, None
-            
-        except Exception as e:
-            print(f"Error en autenticación: {e}")
-            self.update_status("Error en reconocimiento", "⚠️", "#ea4335")
-            return display_frame, None
-
-    def fallback_face_detection(self, frame):
-        """Detección básica de rostros cuando no hay sistema disponible"""
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        face_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-        )
-        faces = face_cascade.detectMultiScale(gray, 1.1, 4)
-        
-        for (x, y, w, h) in faces:
-            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-            cv2.putText(frame, "Rostro Detectado", (x, y-10), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-            
-            self.update_status("Rostro detectado (modo básico)", "👤", "#fbbc04")
-            self.face_detected = True
-            
-            if not self.auth_start_time:
-                self.auth_start_time = datetime.now()  
-            
-            elapsed = (datetime.now() - self.auth_start_time).total_seconds()
-            progress = min(int((elapsed / 3) * 100), 100)
-            self.progress_bar.setValue(progress)
-            
-            if elapsed > 3:
-                user_data = {
-                    "authenticated": True,
-                    "name": "Usuario Demo",
-                    "id": "demo_001",
-                    "confidence": 0.95,
-                    "metadata": {"demo": True}
-                }
-                return user_data
-        
-        return None
-def test_face_system():
-    print("Probando FaceSystem...")
-    
-    try:
-        face_system = FaceSystem()
-        
-        print(f"Sistema inicializado. Usuarios: {face_system.get_user_count()}")
-        
-        if face_system.get_user_count() > 0:
-            print(f"Usuarios registrados: {', '.join(face_system.get_user_list())}")
-        
-        return face_system
-        
-    except Exception as e:
-        print(f"Error: {e}")
-        return None
-
-if __name__ == "__main__":
-    system = test_face_system()
-    if system:
-
-        print("FaceSystem está funcionando correctamente.")
+import os
+import cv2
+import pickle
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json
+from pathlib import Path
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+try:
+    import torch
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def _finalize_embedding(flat):
+        """Normaliza L2 in situ en una sola pasada SIMD (sin temporales)."""
+        s = 0.0
+        for i in range(flat.size):
+            s += flat[i] * flat[i]
+        inv = 1.0 / np.sqrt(s) if s > 0 else 0.0
+        for i in range(flat.size):
+            flat[i] *= inv
+        return flat
+
+    @njit(cache=True, parallel=True, fastmath=True)
+    def _matvec_sims(matrix, vector):
+        """Producto matriz-vector paralelo para la búsqueda de similitud."""
+        n = matrix.shape[0]
+        out = np.empty(n, np.float32)
+        for i in prange(n):
+            s = 0.0
+            for k in range(matrix.shape[1]):
+                s += matrix[i, k] * vector[k]
+            out[i] = s
+        return out
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _match_batch(matrix, queries):
+        """Similitudes (K consultas x N conocidos) paralelizadas por consulta."""
+        n = matrix.shape[0]
+        d = matrix.shape[1]
+        k = queries.shape[0]
+        out = np.empty((k, n), np.float32)
+        for q in prange(k):
+            for i in range(n):
+                s = 0.0
+                for j in range(d):
+                    s += matrix[i, j] * queries[q, j]
+                out[q, i] = s
+        return out
+
+class FaceSystem:
+    # Se incrementa cuando cambia el formato de los embeddings cacheados
+    CACHE_VERSION = '2.0'
+
+    # Similitud coseno a partir de la cual un barrido por bloques puede
+    # cortar sin mirar el resto de la base (confianza (s+1)/2 >= 0.97)
+    EARLY_EXIT_SIM = 0.94
+    SCAN_BLOCK = 32
+
+    def __init__(self, registros_path="data/known_faces", cache_path="data/cache"):
+        self.base_path = Path(registros_path)
+        self.cache_path = Path(cache_path)
+        # Matriz cruda float32 mapeable en memoria + cabecera con los nombres
+        self.encodings_matrix_file = self.cache_path / "face_embeddings.f32"
+        self.encodings_header_file = self.cache_path / "face_embeddings.json"
+        # Formato antiguo, solo como fallback de lectura/escritura
+        self.encodings_cache_pkl = self.cache_path / "face_embeddings.pkl"
+        
+        self.base_path.mkdir(parents=True, exist_ok=True)
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        
+        try:
+            import mediapipe as mp
+            self.mp = mp
+            
+            self.face_detection = mp.solutions.face_detection.FaceDetection(
+                model_selection=1,
+                min_detection_confidence=0.5
+            )
+            
+            self.face_mesh = mp.solutions.face_mesh.FaceMesh(
+                static_image_mode=True,
+                max_num_faces=1,
+                refine_landmarks=True,
+                min_detection_confidence=0.5,
+                min_tracking_confidence=0.5
+            )
+            
+            self.face_detection_available = True
+            logger.info("MediaPipe inicializado correctamente")
+            
+        except ImportError as e:
+            logger.error(f"Error al importar MediaPipe: {e}")
+            self.face_detection_available = False
+            raise ImportError("MediaPipe no está instalado. Ejecuta: pip install mediapipe==0.10.14")
+        
+        self.known_embeddings = []
+        self.known_names = []
+        # Índice nombre → posición para consultas O(1) (el orden de las
+        # listas y la matriz se mantiene alineado)
+        self._name_to_idx = {}
+
+        self.min_face_size = 100
+        # Umbral sobre confianza coseno: (sim + 1) / 2, ver recognize_face
+        self.confidence_threshold = 0.90
+        # El detector mantiene su precisión por encima de ~320 px; procesar
+        # a media resolución cuesta 1/4 de los píxeles
+        self.detect_scale = 0.5
+
+        # Matriz (N, D) apilada de embeddings para comparar sin bucle
+        # Python; vista sobre un buffer de crecimiento geométrico
+        self._known_matrix = None
+        self._matrix_buf = None
+        self._matrix_n = 0
+
+        # Copia de la matriz residente en GPU (opcional, ver set_device)
+        self._use_torch = False
+        self._gpu_matrix = None
+
+        # Base cuantizada a int8 (opcional, ver quantize_db)
+        self._db_q = None
+        self._db_scales = None
+
+        # mtime de la imagen de cada usuario, para refrescar solo lo cambiado
+        self._image_mtimes = {}
+
+        # Buffers RGB reutilizados por frame, uno por punto de llamada
+        # (frame reducido de detección, recorte de reconocimiento)
+        self._rgb_bufs = {}
+
+        # Índice FAISS opcional (producto interno exacto = coseno sobre
+        # vectores unitarios), con SIMD/OpenMP internos
+        self._faiss_index = None
+
+        # Detectores del modo fallback, cargados una sola vez bajo demanda:
+        # YuNet INT8 (DNN, ~1-2 ms/frame) si el modelo está disponible,
+        # cascada Haar en caso contrario
+        self._haar_cascade = None
+        self._yunet = None
+        self._yunet_checked = False
+        self._yunet_model_path = os.path.join(
+            "data", "models", "face_detection_yunet_2023mar_int8.onnx")
+
+        # Embebedor CNN opcional (ONNX estilo FaceNet); si el modelo está
+        # presente sustituye a los landmarks como fuente del embedding
+        self._embed_net = None
+        self._embed_net_path = os.path.join(
+            "data", "models", "face_embedder.onnx")
+        self._use_embed_net = os.path.exists(self._embed_net_path)
+        # Fuente de los embeddings persistidos; si cambia (aparece o
+        # desaparece el modelo ONNX) la caché deja de ser comparable y
+        # se regenera desde las imágenes
+        self._embed_source = 'dnn' if self._use_embed_net else 'mesh'
+
+        # Instancias FaceMesh por hilo para la carga paralela de imágenes
+        # (el grafo de MediaPipe no es seguro entre hilos)
+        self._tls = threading.local()
+        
+        self.load_database()
+
+        if NUMBA_AVAILABLE:
+            # Calentar los JIT para que el primer reconocimiento no pague
+            # la compilación
+            _matvec_sims(np.zeros((1, 1404), dtype=np.float32),
+                         np.zeros(1404, dtype=np.float32))
+            _match_batch(np.zeros((1, 1404), dtype=np.float32),
+                         np.zeros((1, 1404), dtype=np.float32))
+            _finalize_embedding(np.zeros(1404, dtype=np.float32))
+
+        logger.info(f"Sistema facial inicializado. Usuarios registrados: {len(self.known_names)}")
+
+    def set_device(self, device):
+        """Selecciona el dispositivo para las operaciones de OpenCV.
+
+        MediaPipe en Python ejecuta sus grafos siempre en CPU, así que el
+        GPU solo acelera el pre/post-procesado OpenCV (cvtColor, resize,
+        dibujo) vía OpenCL transparente (UMat).
+        """
+        device = device.lower()
+
+        if device == "cuda" and TORCH_AVAILABLE and torch.cuda.is_available():
+            # Matriz residente en GPU: cada consulta sube solo el vector
+            # (~5 KB) y el matmul queda limitado por ancho de banda de VRAM
+            self._use_torch = True
+            self._sync_gpu_matrix()
+            logger.info("Comparación de embeddings en GPU (torch)")
+            return True
+
+        self._use_torch = False
+        self._gpu_matrix = None
+
+        if device in ("cuda", "opencl", "gpu"):
+            cv2.ocl.setUseOpenCL(True)
+            if cv2.ocl.useOpenCL():
+                logger.info("OpenCL habilitado para operaciones OpenCV")
+                return True
+            logger.warning("No hay dispositivo OpenCL disponible, usando CPU")
+            return False
+
+        cv2.ocl.setUseOpenCL(False)
+        logger.info("Operaciones OpenCV en CPU")
+        return True
+
+    def __del__(self):
+        # Liberar los delegados TFLite; si no, instanciar FaceSystem varias
+        # veces (p. ej. en pruebas) va acumulando memoria de grafos
+        try:
+            if getattr(self, 'face_mesh', None) is not None:
+                self.face_mesh.close()
+            if getattr(self, 'face_detection', None) is not None:
+                self.face_detection.close()
+        except Exception:
+            pass
+
+    def load_database(self):
+        logger.info("Cargando base de datos de rostros...")
+        
+        if self._load_from_cache():
+            refreshed = self._refresh_stale_images()
+            logger.info(f"Base cargada desde caché: {len(self.known_names)} usuarios "
+                        f"({refreshed} actualizados)")
+            return True
+
+        return self._load_from_images()
+
+    def _load_from_cache(self):
+        try:
+            if self.encodings_matrix_file.exists() and self.encodings_header_file.exists():
+                with open(self.encodings_header_file, 'r', encoding='utf-8') as f:
+                    header = json.load(f)
+
+                if header.get('version') != self.CACHE_VERSION:
+                    logger.info("Caché de otra versión, se regenera desde imágenes")
+                    return False
+
+                if header.get('embed_source', 'mesh') != self._embed_source:
+                    logger.info("Caché de otra fuente de embeddings, se regenera")
+                    return False
+
+                n = header['n']
+                dim = header['dim']
+
+                # Mapeo de solo lectura: el SO pagina bajo demanda y el
+                # arranque no deserializa nada
+                matrix = np.memmap(self.encodings_matrix_file, dtype=np.float32,
+                                   mode='r', shape=(n, dim))
+
+                self.known_embeddings = list(matrix)
+                self.known_names = list(header['names'])
+                self._rebuild_name_index()
+                self._image_mtimes = dict(header.get('mtimes', {}))
+                self._matrix_buf = matrix
+                self._matrix_n = n
+                self._known_matrix = matrix
+                return True
+
+            if self.encodings_cache_pkl.exists():
+                with open(self.encodings_cache_pkl, 'rb') as f:
+                    cache_data = pickle.load(f)
+
+                if cache_data.get('version') != self.CACHE_VERSION:
+                    logger.info("Caché de otra versión, se regenera desde imágenes")
+                    return False
+
+                if cache_data.get('embed_source', 'mesh') != self._embed_source:
+                    logger.info("Caché de otra fuente de embeddings, se regenera")
+                    return False
+
+                if 'embeddings' in cache_data and 'names' in cache_data:
+                    self.known_embeddings = [
+                        np.asarray(e, dtype=np.float32)
+                        for e in cache_data['embeddings']
+                    ]
+                    self.known_names = cache_data['names']
+                    self._rebuild_name_index()
+                    self._image_mtimes = dict(cache_data.get('mtimes', {}))
+                    self._rebuild_matrix()
+                    return True
+
+        except Exception as e:
+            logger.warning(f"Error cargando caché: {e}")
+        
+        return False
+
+    def _load_from_images(self):
+        valid_extensions = ('.jpg', '.jpeg', '.png', '.bmp')
+        loaded_count = 0
+
+        file_paths = [
+            p for p in self.base_path.iterdir()
+            if p.suffix.lower() in valid_extensions
+        ]
+
+        if file_paths:
+            # Lectura e inferencia en paralelo: OpenCV y MediaPipe liberan
+            # el GIL en su código C
+            workers = min(len(file_paths), os.cpu_count() or 1)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for file_path, result in zip(
+                        file_paths,
+                        executor.map(self._embed_image_file, file_paths)):
+                    if result is not None:
+                        name, embedding = result
+                        self.known_embeddings.append(embedding)
+                        self.known_names.append(name)
+                        self._image_mtimes[name] = file_path.stat().st_mtime
+                        loaded_count += 1
+                        logger.info(f"Cargado: {name}")
+
+        self._rebuild_name_index()
+        self._rebuild_matrix()
+
+        if loaded_count > 0:
+            self._save_to_cache()
+
+        logger.info(f"Total usuarios cargados: {loaded_count}")
+        return loaded_count > 0
+
+    def _refresh_stale_images(self):
+        """Re-embebe solo las imágenes nuevas o con mtime distinto al cacheado.
+
+        Hace el arranque templado O(archivos cambiados) en lugar de pagar
+        la inferencia de MediaPipe por cada imagen registrada.
+        """
+        valid_extensions = ('.jpg', '.jpeg', '.png', '.bmp')
+        refreshed = 0
+
+        try:
+            stale = []
+            for file_path in self.base_path.iterdir():
+                if file_path.suffix.lower() not in valid_extensions:
+                    continue
+
+                mtime = file_path.stat().st_mtime
+                if self._image_mtimes.get(file_path.stem) != mtime:
+                    stale.append((file_path, mtime))
+
+            for file_path, mtime in stale:
+                result = self._embed_image_file(file_path)
+                if result is None:
+                    continue
+
+                name, embedding = result
+                idx = self._name_to_idx.get(name)
+                if idx is not None:
+                    self.known_embeddings[idx] = embedding
+                else:
+                    self.known_embeddings.append(embedding)
+                    self.known_names.append(name)
+                    self._name_to_idx[name] = len(self.known_names) - 1
+
+                self._image_mtimes[name] = mtime
+                refreshed += 1
+                logger.info(f"Actualizado: {name}")
+
+            if refreshed:
+                self._rebuild_matrix()
+                self._save_to_cache()
+
+        except Exception as e:
+            logger.warning(f"Error refrescando imágenes: {e}")
+
+        return refreshed
+
+    def _thread_face_mesh(self):
+        """FaceMesh propio del hilo actual (se crea a demanda)."""
+        mesh = getattr(self._tls, 'face_mesh', None)
+        if mesh is None:
+            mesh = self.mp.solutions.face_mesh.FaceMesh(
+                static_image_mode=True,
+                max_num_faces=1,
+                refine_landmarks=True,
+                min_detection_confidence=0.5,
+                min_tracking_confidence=0.5
+            )
+            self._tls.face_mesh = mesh
+        return mesh
+
+    def _thread_embed_net(self):
+        """Red ONNX propia del hilo actual (cv2.dnn no es reentrante)."""
+        net = getattr(self._tls, 'embed_net', None)
+        if net is None:
+            net = cv2.dnn.readNetFromONNX(self._embed_net_path)
+            self._tls.embed_net = net
+        return net
+
+    def _embed_image_file(self, file_path):
+        """Procesa un archivo de imagen; devuelve (nombre, embedding) o None."""
+        try:
+            image = cv2.imread(str(file_path))
+            if image is None:
+                logger.warning(f"No se pudo leer: {file_path.name}")
+                return None
+
+            # Misma fuente de embeddings que el reconocimiento: mezclar
+            # vectores DNN y de landmarks rompería la matriz apilada
+            if self._use_embed_net:
+                embedding = self._extract_face_embedding_dnn(
+                    image, net=self._thread_embed_net())
+                if embedding is None:
+                    return None
+                return file_path.stem, embedding
+
+            # Conversión local al hilo: no se comparte el buffer RGB
+            rgb_image = cv2.cvtColor(self._downscale_for_mesh(image),
+                                     cv2.COLOR_BGR2RGB)
+            results = self._thread_face_mesh().process(rgb_image)
+
+            if results.multi_face_landmarks:
+                embedding = self._landmarks_to_embedding(results.multi_face_landmarks[0])
+                return file_path.stem, embedding
+
+            return None
+
+        except Exception as e:
+            logger.error(f"Error procesando {file_path.name}: {e}")
+            return None
+
+    def _to_rgb(self, image, slot='detect'):
+        """Convierte BGR→RGB reutilizando un buffer por punto de llamada.
+
+        Un buffer por slot, reasignado solo si cambia la forma: los
+        recortes de reconocimiento varían ligeramente cada frame y un
+        buffer por forma crecería sin límite.
+        """
+        buf = self._rgb_bufs.get(slot)
+        if buf is None or buf.shape != image.shape:
+            buf = np.empty_like(image)
+            self._rgb_bufs[slot] = buf
+        cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=buf)
+        return buf
+
+    @classmethod
+    def _downscale_for_mesh(cls, image):
+        """Reduce la imagen al tamaño útil para FaceMesh.
+
+        Los landmarks x/y salen normalizados [0, 1], así que el embedding
+        no depende de la escala de entrada.
+        """
+        h, w = image.shape[:2]
+        scale = cls.MESH_INPUT_MAX_EDGE / max(h, w)
+
+        if scale < 1.0:
+            image = cv2.resize(image, (int(w * scale), int(h * scale)),
+                               interpolation=cv2.INTER_AREA)
+
+        return image
+
+    @staticmethod
+    def _landmarks_to_embedding(face_landmarks):
+        landmarks = face_landmarks.landmark
+        embedding = np.fromiter(
+            (value for point in landmarks
+             for value in (point.x, point.y, point.z)),
+            dtype=np.float32,
+            count=len(landmarks) * 3
+        )
+
+        # Normalizar L2: la comparación por coseno se reduce a un
+        # producto interno sobre vectores unitarios
+        if NUMBA_AVAILABLE:
+            return _finalize_embedding(embedding)
+
+        embedding /= (np.linalg.norm(embedding) + 1e-12)
+        return embedding
+
+    # El modelo FaceMesh trabaja internamente a 192x192; entradas mayores
+    # solo encarecen la conversión y copia previas
+    MESH_INPUT_MAX_EDGE = 256
+
+    # Desviación típica (sobre una miniatura 32x32) por debajo de la cual
+    # el frame se considera vacío (cámara arrancando, lente tapada) y no
+    # merece pasar por MediaPipe
+    MIN_FRAME_STD = 5.0
+
+    @classmethod
+    def _is_blank_frame(cls, image):
+        """True si la imagen es casi uniforme; la miniatura cuesta microsegundos."""
+        thumb = cv2.resize(image, (32, 32), interpolation=cv2.INTER_AREA)
+        return thumb.std() < cls.MIN_FRAME_STD
+
+    def _extract_face_embedding_dnn(self, image, net=None):
+        """Embedding vía red ONNX con preprocesado fusionado de cv2.dnn.
+
+        blobFromImage hace resize, normalización y cambio de canales en
+        un solo kernel SIMD en lugar de tres pasadas separadas. Solo se
+        usa si data/models/face_embedder.onnx existe. net permite pasar
+        una instancia por hilo desde la carga paralela.
+        """
+        if net is None:
+            if self._embed_net is None:
+                self._embed_net = cv2.dnn.readNetFromONNX(self._embed_net_path)
+            net = self._embed_net
+
+        blob = cv2.dnn.blobFromImage(
+            image, scalefactor=1 / 127.5, size=(160, 160),
+            mean=(127.5, 127.5, 127.5), swapRB=True, crop=False)
+        net.setInput(blob)
+        embedding = net.forward().ravel().astype(np.float32)
+
+        norm = np.linalg.norm(embedding)
+        embedding /= (norm + 1e-12)
+        return embedding
+
+    def _extract_face_embedding(self, image):
+        try:
+            if self._is_blank_frame(image):
+                return None
+
+            if self._use_embed_net:
+                return self._extract_face_embedding_dnn(image)
+
+            image = self._downscale_for_mesh(image)
+            rgb_image = self._to_rgb(image, slot='embed')
+            results = self.face_mesh.process(rgb_image)
+
+            if results.multi_face_landmarks:
+                return self._landmarks_to_embedding(results.multi_face_landmarks[0])
+
+            return None
+            
+        except Exception as e:
+            logger.error(f"Error extrayendo embedding: {e}")
+            return None
+
+    def _append_row_to_cache(self, embedding):
+        """Añade una sola fila al fichero de matriz sin reescribirlo.
+
+        Mantiene la escritura por registro en O(1) (una fila más la
+        cabecera JSON, que es pequeña) en lugar de O(N) filas. Si el
+        fichero no coincide con el estado previo, cae a la reescritura
+        completa de _save_to_cache.
+        """
+        try:
+            if self._known_matrix is None or not os.path.exists(self.encodings_matrix_file):
+                return self._save_to_cache()
+
+            n, dim = self._known_matrix.shape
+            expected = (n - 1) * dim * 4
+            if os.path.getsize(self.encodings_matrix_file) != expected:
+                return self._save_to_cache()
+
+            with open(self.encodings_matrix_file, 'ab') as f:
+                np.ascontiguousarray(embedding, dtype=np.float32).tofile(f)
+
+            self._write_cache_header()
+            logger.info(f"Cache guardada: {len(self.known_names)} usuarios")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error añadiendo fila a la caché: {e}")
+            return self._save_to_cache()
+
+    def _write_cache_header(self):
+        header = {
+            'n': int(self._known_matrix.shape[0]),
+            'dim': int(self._known_matrix.shape[1]),
+            'names': list(self.known_names),
+            'mtimes': self._image_mtimes,
+            'version': self.CACHE_VERSION,
+            'embed_source': self._embed_source,
+            'timestamp': datetime.now().isoformat()
+        }
+
+        tmp_path = str(self.encodings_header_file) + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(header, f, ensure_ascii=False)
+        os.replace(tmp_path, self.encodings_header_file)
+
+    def _save_to_cache(self):
+        try:
+            if self._known_matrix is not None:
+                # Matriz cruda contigua (mapeable con np.memmap) más una
+                # cabecera JSON pequeña con forma, nombres y versión.
+                # Se escribe a un temporal y se reemplaza de forma atómica:
+                # reescribir el fichero en el sitio truncaría el inodo que
+                # aún respalda las vistas memmap de known_embeddings (el
+                # acceso a una página desmapeada mata el proceso con
+                # SIGBUS, no con una excepción), y además deja la caché
+                # íntegra si el proceso cae a mitad de escritura
+                tmp_path = str(self.encodings_matrix_file) + '.tmp'
+                np.ascontiguousarray(self._known_matrix).tofile(tmp_path)
+                os.replace(tmp_path, self.encodings_matrix_file)
+                self._write_cache_header()
+            else:
+                # Embeddings de dimensiones mixtas: pickle como fallback
+                cache_data = {
+                    'embeddings': [e.astype(np.float16) for e in self.known_embeddings],
+                    'names': self.known_names,
+                    'mtimes': self._image_mtimes,
+                    'timestamp': datetime.now().isoformat(),
+                    'version': self.CACHE_VERSION,
+                    'embed_source': self._embed_source
+                }
+
+                tmp_path = str(self.encodings_cache_pkl) + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump(cache_data, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self.encodings_cache_pkl)
+
+            logger.info(f"Cache guardada: {len(self.known_names)} usuarios")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error guardando caché: {e}")
+            return False
+
+    def register_face(self, image, name):
+        try:
+            safe_name = "".join(c for c in name if c.isalnum() or c in (' ', '_', '-')).strip()
+            if not safe_name or len(safe_name) < 2:
+                return False, "Nombre inválido. Debe tener al menos 2 caracteres."
+            
+            if safe_name in self._name_to_idx:
+                return False, f"El nombre '{safe_name}' ya está registrado."
+            
+            embedding = self._extract_face_embedding(image)
+            if embedding is None:
+                return False, "No se detectó un rostro claro en la imagen."
+            
+            image_path = self.base_path / f"{safe_name}.jpg"
+            cv2.imwrite(str(image_path), image)
+            self._image_mtimes[safe_name] = image_path.stat().st_mtime
+            
+            self.known_embeddings.append(embedding)
+            self.known_names.append(safe_name)
+            self._name_to_idx[safe_name] = len(self.known_names) - 1
+            self._append_to_matrix(embedding)
+
+            if self._db_q is not None:
+                self.quantize_db()
+
+            self._append_row_to_cache(embedding)
+            self._save_metadata(safe_name, image_path)
+            
+            return True, f"Usuario '{safe_name}' registrado exitosamente."
+            
+        except Exception as e:
+            logger.error(f"Error registrando rostro: {e}")
+            return False, f"Error durante el registro: {str(e)}"
+
+    def _save_metadata(self, name, image_path):
+        try:
+            metadata_path = self.base_path / f"{name}_metadata.json"
+            metadata = {
+                "name": name,
+                "registered_date": datetime.now().isoformat(),
+                "image_path": str(image_path),
+                "last_seen": None,
+                "access_count": 0
+            }
+            
+            if ORJSON_AVAILABLE:
+                with open(metadata_path, 'wb') as f:
+                    f.write(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
+            else:
+                with open(metadata_path, 'w', encoding='utf-8') as f:
+                    json.dump(metadata, f, indent=2, ensure_ascii=False)
+                
+        except Exception as e:
+            logger.warning(f"Error guardando metadatos: {e}")
+
+    def _rebuild_name_index(self):
+        self._name_to_idx = {n: i for i, n in enumerate(self.known_names)}
+
+    def _rebuild_matrix(self):
+        """Reconstruye la matriz (N, D) apilada de embeddings conocidos."""
+        try:
+            if self.known_embeddings:
+                n = len(self.known_embeddings)
+                dim = self.known_embeddings[0].shape[0]
+
+                self._matrix_buf = np.empty((max(8, n), dim), dtype=np.float32)
+                self._matrix_buf[:n] = np.stack(self.known_embeddings)
+                self._matrix_n = n
+                self._known_matrix = self._matrix_buf[:n]
+            else:
+                self._matrix_buf = None
+                self._matrix_n = 0
+                self._known_matrix = None
+
+            self._sync_gpu_matrix()
+            self._sync_faiss_index()
+        except Exception as e:
+            logger.warning(f"No se pudo apilar embeddings: {e}")
+            self._matrix_buf = None
+            self._matrix_n = 0
+            self._known_matrix = None
+
+    def _sync_gpu_matrix(self):
+        """Replica la matriz de embeddings en la GPU si está habilitada."""
+        if not self._use_torch:
+            return
+
+        if self._known_matrix is None:
+            self._gpu_matrix = None
+        else:
+            self._gpu_matrix = torch.from_numpy(
+                np.ascontiguousarray(self._known_matrix)
+            ).cuda()
+
+    def _sync_faiss_index(self, new_row=None):
+        """Mantiene el índice FAISS alineado con la matriz de conocidos."""
+        if not FAISS_AVAILABLE:
+            return
+
+        if self._known_matrix is None:
+            self._faiss_index = None
+            return
+
+        if (new_row is not None and self._faiss_index is not None
+                and self._faiss_index.d == new_row.shape[0]
+                and self._faiss_index.ntotal == self._known_matrix.shape[0] - 1):
+            self._faiss_index.add(np.ascontiguousarray(new_row).reshape(1, -1))
+            return
+
+        index = faiss.IndexFlatIP(self._known_matrix.shape[1])
+        index.add(np.ascontiguousarray(self._known_matrix))
+        self._faiss_index = index
+
+    def _append_to_matrix(self, embedding):
+        """Añade una fila al buffer apilado en O(D) amortizado."""
+        if (self._matrix_buf is None
+                or not self._matrix_buf.flags.writeable
+                or embedding.shape[0] != self._matrix_buf.shape[1]):
+            # known_embeddings ya contiene el nuevo vector
+            self._rebuild_matrix()
+            return
+
+        if self._matrix_n == self._matrix_buf.shape[0]:
+            new_buf = np.empty(
+                (self._matrix_buf.shape[0] * 2, self._matrix_buf.shape[1]),
+                dtype=np.float32
+            )
+            new_buf[:self._matrix_n] = self._matrix_buf[:self._matrix_n]
+            self._matrix_buf = new_buf
+
+        self._matrix_buf[self._matrix_n] = embedding
+        self._matrix_n += 1
+        self._known_matrix = self._matrix_buf[:self._matrix_n]
+        self._sync_gpu_matrix()
+        self._sync_faiss_index(new_row=embedding)
+
+    def _remove_from_matrix(self, idx):
+        """Elimina la fila idx intercambiándola con la última (O(D))."""
+        if self._matrix_buf is None:
+            return
+
+        if not self._matrix_buf.flags.writeable:
+            # Respaldo memmap de solo lectura: reconstruir en memoria normal
+            # (las listas ya no contienen la entrada eliminada)
+            self._rebuild_matrix()
+            return
+
+        last = self._matrix_n - 1
+        if idx != last:
+            self._matrix_buf[idx] = self._matrix_buf[last]
+
+        self._matrix_n = last
+        self._known_matrix = self._matrix_buf[:last] if last > 0 else None
+        self._sync_gpu_matrix()
+        self._sync_faiss_index()
+
+    def quantize_db(self):
+        """Cuantiza la base de embeddings a int8 con escala por vector.
+
+        Reduce la memoria de la base 4x y permite comparar con productos
+        enteros. Llamar de nuevo tras registrar o eliminar usuarios.
+        """
+        try:
+            if not self.known_embeddings:
+                self._db_q = None
+                self._db_scales = None
+                return False
+
+            matrix = np.stack(self.known_embeddings).astype(np.float32)
+            scales = np.abs(matrix).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+
+            self._db_q = np.round(matrix / scales[:, None]).astype(np.int8)
+            self._db_scales = scales.astype(np.float32)
+
+            logger.info(f"Base cuantizada a int8: {len(self.known_names)} usuarios")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error cuantizando base: {e}")
+            self._db_q = None
+            return False
+
+    def _recognize_quantized(self, embedding):
+        """Busca el mejor match sobre la base int8 cuantizada."""
+        scale_q = np.abs(embedding).max() / 127.0
+        if scale_q == 0:
+            return "Desconocido", 0.0
+
+        query_q = np.round(embedding / scale_q).astype(np.int32)
+
+        # Vectores unitarios: el producto interno (en enteros) es el coseno
+        sims = (self._db_q.astype(np.int32) @ query_q) * self._db_scales * scale_q
+
+        best_idx = int(np.argmax(sims))
+        confidence = (float(sims[best_idx]) + 1.0) * 0.5
+
+        if confidence >= self.confidence_threshold:
+            return self.known_names[best_idx], confidence
+        return "Desconocido", confidence
+
+    def recognize_face(self, face_image):
+        try:
+            if len(self.known_embeddings) == 0:
+                return "Desconocido", 0.0
+            
+            embedding = self._extract_face_embedding(face_image)
+            if embedding is None:
+                return "Desconocido", 0.0
+
+            if self._db_q is not None:
+                return self._recognize_quantized(embedding)
+
+            if self._known_matrix is not None:
+                # Vectores unitarios: la similitud coseno es un solo GEMV.
+                # No hay poda por ventana de normas posible aquí: tras la
+                # normalización L2 todas las normas son 1, y el GEMV por
+                # lotes ya es más barato que cualquier filtro por candidato.
+                if self._use_torch and self._gpu_matrix is not None:
+                    query = torch.from_numpy(embedding).cuda(non_blocking=True)
+                    sims = (self._gpu_matrix @ query).cpu().numpy()
+                    best_idx = int(np.argmax(sims))
+                    best_match = self.known_names[best_idx]
+                    best_similarity = float(sims[best_idx])
+                elif self._faiss_index is not None:
+                    sims, idxs = self._faiss_index.search(
+                        embedding.reshape(1, -1), 1)
+                    best_idx = int(idxs[0, 0])
+                    best_match = self.known_names[best_idx]
+                    best_similarity = float(sims[0, 0])
+                elif NUMBA_AVAILABLE:
+                    sims = _matvec_sims(self._known_matrix, embedding)
+                    best_idx = int(np.argmax(sims))
+                    best_match = self.known_names[best_idx]
+                    best_similarity = float(sims[best_idx])
+                else:
+                    # Barrido por bloques con salida temprana: cada bloque
+                    # sigue siendo un GEMV vectorizado, pero si aparece una
+                    # similitud claramente ganadora no hace falta recorrer
+                    # el resto de la base
+                    matrix = self._known_matrix
+                    best_idx = -1
+                    best_similarity = -1.0
+                    for start in range(0, matrix.shape[0], self.SCAN_BLOCK):
+                        sims = matrix[start:start + self.SCAN_BLOCK] @ embedding
+                        local = int(np.argmax(sims))
+                        if sims[local] > best_similarity:
+                            best_similarity = float(sims[local])
+                            best_idx = start + local
+                        if best_similarity >= self.EARLY_EXIT_SIM:
+                            break
+                    best_match = self.known_names[best_idx]
+            else:
+                best_match = None
+                best_similarity = -1.0
+
+                for known_embedding, known_name in zip(self.known_embeddings, self.known_names):
+                    similarity = float(np.dot(embedding, known_embedding))
+
+                    if similarity > best_similarity:
+                        best_similarity = similarity
+                        best_match = known_name
+
+            confidence = (best_similarity + 1.0) * 0.5
+            
+            if confidence >= self.confidence_threshold:
+                return best_match, confidence
+            else:
+                return "Desconocido", confidence
+            
+        except Exception as e:
+            logger.error(f"Error reconociendo rostro: {e}")
+            return "Desconocido", 0.0
+
+    def recognize_faces(self, face_images):
+        """Reconoce varios rostros con una sola multiplicación de matrices.
+
+        Devuelve una lista de (nombre, confianza) en el mismo orden que
+        face_images; amortiza el coste de despacho sobre todas las caras
+        del frame frente a llamar recognize_face por recorte.
+        """
+        results = [("Desconocido", 0.0)] * len(face_images)
+
+        try:
+            if len(self.known_embeddings) == 0:
+                return results
+
+            embeddings = []
+            index_map = []
+
+            for i, face_image in enumerate(face_images):
+                embedding = self._extract_face_embedding(face_image)
+                if embedding is not None:
+                    embeddings.append(embedding)
+                    index_map.append(i)
+
+            if not embeddings:
+                return results
+
+            if self._known_matrix is not None:
+                queries = np.stack(embeddings)
+                if NUMBA_AVAILABLE:
+                    sims = _match_batch(self._known_matrix, queries)
+                else:
+                    sims = queries @ self._known_matrix.T
+
+                best = sims.argmax(axis=1)
+                for row, i in enumerate(index_map):
+                    confidence = (float(sims[row, best[row]]) + 1.0) * 0.5
+                    if confidence >= self.confidence_threshold:
+                        results[i] = (self.known_names[int(best[row])], confidence)
+                    else:
+                        results[i] = ("Desconocido", confidence)
+            else:
+                for i, embedding in zip(index_map, embeddings):
+                    best_match = None
+                    best_similarity = -1.0
+
+                    for known_embedding, known_name in zip(self.known_embeddings, self.known_names):
+                        similarity = float(np.dot(embedding, known_embedding))
+                        if similarity > best_similarity:
+                            best_similarity = similarity
+                            best_match = known_name
+
+                    confidence = (best_similarity + 1.0) * 0.5
+                    if confidence >= self.confidence_threshold:
+                        results[i] = (best_match, confidence)
+                    else:
+                        results[i] = ("Desconocido", confidence)
+
+            return results
+
+        except Exception as e:
+            logger.error(f"Error reconociendo rostros en lote: {e}")
+            return results
+
+    def detect_faces(self, frame):
+        if not self.face_detection_available:
+            return []
+        
+        try:
+            if self._is_blank_frame(frame):
+                return []
+
+            if self.detect_scale < 1.0:
+                small = cv2.resize(frame, None, fx=self.detect_scale,
+                                   fy=self.detect_scale,
+                                   interpolation=cv2.INTER_AREA)
+            else:
+                small = frame
+
+            # Las cajas devueltas son relativas [0, 1], así que se escalan
+            # directamente al tamaño del frame original
+            rgb_frame = self._to_rgb(small)
+            results = self.face_detection.process(rgb_frame)
+            
+            face_locations = []
+
+            if results.detections:
+                h, w, _ = frame.shape
+
+                # Recorte de cajas sin ramas: un solo clip/minimum sobre
+                # todas las detecciones del frame
+                boxes = np.array([
+                    [d.location_data.relative_bounding_box.xmin,
+                     d.location_data.relative_bounding_box.ymin,
+                     d.location_data.relative_bounding_box.width,
+                     d.location_data.relative_bounding_box.height]
+                    for d in results.detections
+                ], dtype=np.float32)
+
+                boxes[:, [0, 2]] *= w
+                boxes[:, [1, 3]] *= h
+                boxes = boxes.astype(np.int32)
+
+                xy = np.clip(boxes[:, :2], 0, None)
+                wh = np.minimum(boxes[:, 2:], np.array([w, h]) - xy)
+                x2y2 = xy + wh
+
+                face_locations = [
+                    (int(x1), int(y1), int(x2), int(y2))
+                    for (x1, y1), (x2, y2) in zip(xy, x2y2)
+                ]
+
+            return face_locations
+            
+        except Exception as e:
+            logger.error(f"Error detectando rostros: {e}")
+            return []
+
+    def get_user_count(self):
+        return len(self.known_names)
+
+    def get_user_list(self):
+        return self.known_names.copy()
+
+    def delete_user(self, name):
+        try:
+            idx = self._name_to_idx.get(name)
+            if idx is None:
+                return False, f"Usuario '{name}' no encontrado."
+            
+            # Intercambio con el último para no desplazar el resto
+            last = len(self.known_names) - 1
+            if idx != last:
+                self.known_names[idx] = self.known_names[last]
+                self.known_embeddings[idx] = self.known_embeddings[last]
+
+            self.known_names.pop()
+            self.known_embeddings.pop()
+            self._remove_from_matrix(idx)
+
+            del self._name_to_idx[name]
+            if idx < len(self.known_names):
+                # El nombre intercambiado desde el final cambió de posición
+                self._name_to_idx[self.known_names[idx]] = idx
+
+            self._image_mtimes.pop(name, None)
+
+            if self._db_q is not None:
+                self.quantize_db()
+            
+            image_path = self.base_path / f"{name}.jpg"
+            metadata_path = self.base_path / f"{name}_metadata.json"
+            
+            if image_path.exists():
+                image_path.unlink()
+            
+            if metadata_path.exists():
+                metadata_path.unlink()
+            
+            self._save_to_cache()
+            
+            return True, f"Usuario '{name}' eliminado exitosamente."
+            
+        except Exception as e:
+            logger.error(f"Error eliminando usuario: {e}")
+            return False, f"Error eliminando usuario: {str(e)}"
+
+    def validate_image_for_registration(self, image):
+        try:
+            if image is None or image.size == 0:
+                return False, "Imagen vacía o no válida."
+            
+            h, w = image.shape[:2]
+            if h < 100 or w < 100:
+                return False, f"Imagen muy pequeña ({w}x{h}). Mínimo 100x100."
+            
+            face_locations = self.detect_faces(image)
+            
+            if len(face_locations) == 0:
+                return False, "No se detectó ningún rostro."
+            
+            if len(face_locations) > 1:
+                return False, "Se detectaron múltiples rostros. Solo debe haber uno."
+            
+            x1, y1, x2, y2 = face_locations[0]
+            face_width = x2 - x1
+            face_height = y2 - y1
+            
+            if face_width < self.min_face_size or face_height < self.min_face_size:
+                return False, f"Rostro muy pequeño ({face_width}x{face_height})."
+            
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            # Media SIMD de OpenCV sobre una muestra 1/16: el brillo solo
+            # actúa como filtro grueso
+            brightness = cv2.mean(np.ascontiguousarray(gray[::4, ::4]))[0]
+            
+            if brightness < 50:
+                return False, "Imagen muy oscura. Mejora la iluminación."
+            elif brightness > 200:
+                return False, "Imagen muy brillante. Reduce la iluminación."
+            
+            return True, "Imagen válida para registro."
+            
+        except Exception as e:
+            logger.error(f"Error validando imagen: {e}")
+            return False, f"Error validando imagen: {str(e)}"
+    
+    def process_frame_with_realtime_auth(self, frame):
+        """Procesar frame con reconocimiento facial usando FaceSystem real"""
+        display_frame = frame.copy()
+        user_data = None
+        
+        if not self.face_system:
+            return self.fallback_face_detection(display_frame), None
+        
+        try:
+            face_locations = self.face_system.detect_faces(frame)
+            
+            if not face_locations:
+                self.face_detected = False
+                self.update_status("Enfócate en la cámara...", "👤", "#ea4335")
+                self.progress_bar.setValue(0)
+                self.consecutive_matches = 0
+                return display_frame, None
+            
+            x1, y1, x2, y2 = face_locations[0]
+            face_region = frame[y1:y2, x1:x2]
+            
+            if face_region.size == 0:
+                return display_frame, None
+            
+            name, confidence = self.face_system.recognize_face(face_region)
+            
+            color = (0, 255, 0) if name != "Desconocido" and confidence >= 0.6 else (0, 0, 255)
+            cv2.rectangle(display_frame, (x1, y1), (x2, y2), color, 2)
+            
+            label = f"{name} ({confidence:.2f})"
+            cv2.putText(display_frame, label, (x1, y1-10), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+            
+            if name != "Desconocido" and confidence >= 0.6:
+                if name == self.last_detected_name:
+                    self.consecutive_matches += 1
+                else:
+                    self.consecutive_matches = 1
+                    self.last_detected_name = name
+                
+                progress = min(int((self.consecutive_matches / self.REQUIRED_MATCHES) * 100), 100)
+                self.progress_bar.setValue(progress)
+                
+                self.update_status(f"Reconociendo: {name}...", "🔍", "#fbbc04")
+                
+                if self.consecutive_matches >= self.REQUIRED_MATCHES:
+                    user_data = {
+                        "authenticated": True,
+                        "name": name,
+                        "id": f"user_{name.lower().replace(' ', '_')}",
+                        "confidence": confidence,
+                        "auth_method": "facial_recognition",
+                        "auth_timestamp": datetime.now().isoformat(),
+                        "metadata": {
+                            "face_system": "MediaPipe",
+                            "confidence_score": confidence,
+                            "last_seen": datetime.now().isoformat()
+                        }
+                    }
+                    
+                    self.update_status(f"¡Autenticado como {name}!", "✅", "#34a853")
+                    return display_frame, user_data
+            else:
+                self.consecutive_matches = 0
+                self.last_detected_name = None
+                self.update_status("Rostro no reconocido", "❓", "#ea4335")
+            
+            return display_frame, None
+            
+        except Exception as e:
+            print(f"Error en autenticación: {e}")
+            self.update_status("Error en reconocimiento", "⚠️", "#ea4335")
+            return display_frame, None
+
+    def _get_yunet(self):
+        """Devuelve el detector YuNet si el modelo INT8 existe, o None"""
+        if not self._yunet_checked:
+            self._yunet_checked = True
+            if hasattr(cv2, 'FaceDetectorYN') and os.path.exists(self._yunet_model_path):
+                try:
+                    self._yunet = cv2.FaceDetectorYN.create(
+                        self._yunet_model_path, "", (320, 320), 0.6, 0.3, 5000)
+                    logger.info("Detector fallback YuNet INT8 cargado")
+                except Exception as e:
+                    logger.warning(f"No se pudo cargar YuNet, usando Haar: {e}")
+        return self._yunet
+
+    def fallback_face_detection(self, frame):
+        """Detección básica de rostros cuando no hay sistema disponible"""
+        yunet = self._get_yunet()
+        if yunet is not None:
+            h, w = frame.shape[:2]
+            yunet.setInputSize((w, h))
+            _, detections = yunet.detect(frame)
+            if detections is None:
+                faces = []
+            else:
+                faces = detections[:, :4].astype(int)
+        else:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+            if self._haar_cascade is None:
+                self._haar_cascade = cv2.CascadeClassifier(
+                    cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+                )
+
+            faces = self._haar_cascade.detectMultiScale(gray, 1.1, 4)
+        
+        for (x, y, w, h) in faces:
+            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+            cv2.putText(frame, "Rostro Detectado", (x, y-10), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+            
+            self.update_status("Rostro detectado (modo básico)", "👤", "#fbbc04")
+            self.face_detected = True
+            
+            if not self.auth_start_time:
+                self.auth_start_time = datetime.now()  
+            
+            elapsed = (datetime.now() - self.auth_start_time).total_seconds()
+            progress = min(int((elapsed / 3) * 100), 100)
+            self.progress_bar.setValue(progress)
+            
+            if elapsed > 3:
+                user_data = {
+                    "authenticated": True,
+                    "name": "Usuario Demo",
+                    "id": "demo_001",
+                    "confidence": 0.95,
+                    "metadata": {"demo": True}
+                }
+                return user_data
+        
+        return None
+def test_face_system():
+    print("Probando FaceSystem...")
+    
+    try:
+        face_system = FaceSystem()
+        
+        print(f"Sistema inicializado. Usuarios: {face_system.get_user_count()}")
+        
+        if face_system.get_user_count() > 0:
+            print(f"Usuarios registrados: {', '.join(face_system.get_user_list())}")
+        
+        return face_system
+        
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+
+if __name__ == "__main__":
+    system = test_face_system()
+    if system:
+
+        print("FaceSystem está funcionando correctamente.")